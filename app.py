@@ -1,16 +1,33 @@
+import os
 import re
+import sys
 import json
+import time
+import queue
+import threading
 import unicodedata
 import io
 import requests
 from bs4 import BeautifulSoup
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import List, Dict
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+try:
+    import orjson  # parser/serializzatore JSON nativo, molto più rapido dello stdlib
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # snapshot binario: più compatto e rapido del JSON testuale
+except ImportError:
+    msgpack = None
+
 # ===============================
 # CONFIG APP
 # ===============================
@@ -24,7 +41,7 @@ st.set_page_config(
 # ===============================
 # COSTANTI & SETTINGS (bloccati da codice)
 # ===============================
-RUOLI = ["P", "D", "C", "A"]
+RUOLI = [sys.intern(r) for r in ("P", "D", "C", "A")]  # interning: confronti per identità O(1)
 QUOTE_ROSA = {"P": 3, "D": 8, "C": 8, "A": 6}
 SETTINGS = {
     "num_squadre": 10,
@@ -44,6 +61,10 @@ FILE2_ID = "1e-0iZhQsavd5_G_KM1ePSXzCJgG0Kn-v"
 DRIVE2_XLSX_URL = f"https://drive.google.com/uc?export=download&id={FILE2_ID}"
 SHEET2_NAME = "Tutti"
 
+# Refresh giornaliero dei dati Drive: vale per le cache in-process, per le
+# copie su disco in .cache/ e per tutte le strutture derivate dai fogli
+SHEET_TTL = 86400
+
 # Campi visibili nella card giocatore (case-insensitive)
 FIELD_LABELS = {
     "team": "Squadra",
@@ -54,6 +75,7 @@ FIELD_LABELS = {
 }
 NAME_COL = "name"  # colonna con il nome del calciatore nel file 1
 ROLE_LABELS = {"P": "Porta", "D": "Difesa", "C": "Centrocampo", "A": "Attacco"}
+ROLE_SECTIONS = [("P", "Portieri"), ("D", "Difensori"), ("C", "Centrocampisti"), ("A", "Attaccanti")]
 
 # ===============================
 # UTILS DI NORMALIZZAZIONE
@@ -65,6 +87,9 @@ def strip_accents(s: str) -> str:
     except Exception:
         return str(s)
 
+# lru_cache: i nomi sono poche migliaia di stringhe ricorrenti — dopo il primo
+# passaggio la normalizzazione per card/lookup è un hit di cache O(1)
+@lru_cache(maxsize=4096)
 def norm_name(s: str) -> str:
     """Normalizza un nome: rimuove accenti, punteggiatura, spazi multipli, lowercase.
     Utile per lookup Slot dal file 1.
@@ -74,6 +99,20 @@ def norm_name(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
+def norm_name_series(s: pd.Series) -> pd.Series:
+    """Versione vettoriale di norm_name per i passaggi bulk: stessa semantica,
+    ma i kernel stringa girano in C su tutta la colonna."""
+    return (
+        s.astype(str)
+         .str.normalize("NFKD")
+         .str.encode("ascii", "ignore")
+         .str.decode("ascii")
+         .str.lower()
+         .str.replace(r"[^a-z0-9]+", " ", regex=True)
+         .str.strip()
+    )
+
+@lru_cache(maxsize=4096)
 def name_key(s: str) -> str:
     """Chiave robusta per confrontare i nomi tra file 1 e file 2.
     - rimuove accenti
@@ -138,7 +177,7 @@ def team_to_fc_slug(team_name: str) -> str | None:
     return slugify(team_name)
 
 # --- ID dal "file 2" (sheet 'Tutti') ---
-@st.cache_data(show_spinner=False)
+@st.cache_data(ttl=SHEET_TTL, show_spinner=False)
 def build_id_index() -> Dict[str, int]:
     """Chiave: 'R|name_key(Nome)' -> Id (int) dal file 2 ('Tutti')."""
     out: Dict[str, int] = {}
@@ -180,57 +219,167 @@ def build_id_index() -> Dict[str, int]:
 # ===============================
 # DATA MODEL
 # ===============================
-@dataclass
+# slots=True: niente __dict__ per istanza (centinaia di giocatori in sessione),
+# accesso agli attributi più rapido; frozen: il giocatore è immutabile per
+# costruzione (le modifiche passano da rimozione + nuovo inserimento)
+@dataclass(slots=True, frozen=True)
 class Giocatore:
     nome: str
     ruolo: str
     prezzo: int
 
-@dataclass
+@dataclass(slots=True)
 class Squadra:
     nome: str
     budget: int
-    rosa: Dict[str, List[Giocatore]] = field(default_factory=lambda: {r: [] for r in RUOLI})
+    # per reparto: dict nome -> Giocatore (ordinato per inserimento, rimozione O(1))
+    rosa: Dict[str, Dict[str, Giocatore]] = field(default_factory=lambda: {r: {} for r in RUOLI})
+    # crediti spesi per reparto, aggiornati incrementalmente (non persistiti)
+    spesa: Dict[str, int] = field(default_factory=lambda: {r: 0 for r in RUOLI})
+
+    @property
+    def spesi(self) -> int:
+        return sum(self.spesa.values())
 
     def to_dict(self):
         return {
             "nome": self.nome,
             "budget": self.budget,
-            "rosa": {r: [asdict(g) for g in self.rosa[r]] for r in RUOLI},
+            # dict costruito a mano: asdict passa da deepcopy/reflection ed è ~10x più lento
+            "rosa": {r: [{"nome": g.nome, "ruolo": g.ruolo, "prezzo": g.prezzo} for g in self.rosa[r].values()] for r in RUOLI},
         }
 
     @staticmethod
     def from_dict(d: dict) -> "Squadra":
-        s = Squadra(d["nome"], d["budget"])
-        s.rosa = {r: [Giocatore(**g) for g in d.get("rosa", {}).get(r, [])] for r in RUOLI}
+        # __new__ + assegnazione diretta: salta __init__ e le default_factory
+        # di rosa/spesa, che qui verrebbero sovrascritte subito dopo
+        s = Squadra.__new__(Squadra)
+        s.nome = d["nome"]
+        s.budget = d["budget"]
+        rosa_in = d.get("rosa", {})
+        # costruzione posizionale: ~2x più rapida dell'unpacking **kwargs
+        s.rosa = {
+            r: {g["nome"]: Giocatore(g["nome"], g["ruolo"], g["prezzo"]) for g in rosa_in.get(r, ())}
+            for r in RUOLI
+        }
+        s.spesa = {r: sum(g.prezzo for g in s.rosa[r].values()) for r in RUOLI}
         return s
 
 # ===============================
 # PERSISTENZA SU FILE (memoria fino al reboot)
 # ===============================
 PERSIST_PATH = Path("lega_state.json")
+# storico acquisti su sidecar JSONL append-only: una riga per acquisto,
+# così lo snapshot non riserializza la storia intera a ogni salvataggio
+STORICO_PATH = Path("lega_storico.jsonl")
+
+def _json_dumps(payload, pretty: bool = False) -> bytes:
+    """Serializza in JSON (orjson se disponibile, stdlib come fallback).
+    Di default emette JSON compatto: il file è riletto solo dalla macchina."""
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(payload, option=opts)
+    if pretty:
+        return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _json_loads(data):
+    """Deserializza JSON da str/bytes (orjson se disponibile)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _writer_loop(q: "queue.Queue"):
+    """Worker in background: riceve bytes già serializzati e li scrive con il
+    pattern tmp + os.replace. La coda tiene al più l'ultimo snapshot."""
+    while True:
+        data = q.get()
+        try:
+            tmp = PERSIST_PATH.with_name(PERSIST_PATH.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, PERSIST_PATH)  # sostituzione atomica: mai file troncati
+        except Exception:
+            pass
 
-def save_state():
+@st.cache_resource(show_spinner=False)
+def _save_queue_start() -> "queue.Queue":
+    """Coda + thread scrittore condivisi tra le sessioni (cache_resource:
+    un solo worker per processo). La coda viene passata come argomento: il
+    thread parte prima che il global _save_queue sia legato."""
+    q = queue.Queue()
+    threading.Thread(target=_writer_loop, args=(q,), daemon=True).start()
+    return q
+
+_save_queue = _save_queue_start()
+
+def _save_state_now():
     try:
+        # La serializzazione legge session_state e resta sul main thread;
+        # il write su disco passa al worker e non blocca lo script-run.
         payload = {
             "settings": st.session_state.get("settings", SETTINGS.copy()),
             "squadre": [s.to_dict() for s in st.session_state.get("squadre", [])],
-            "storico": st.session_state.get("storico_acquisti", []),
             "my_team_idx": st.session_state.get("my_team_idx", 0),
             "user_team_idx": st.session_state.get("user_team_idx", st.session_state.get("my_team_idx", 0)),
         }
-        PERSIST_PATH.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        # scarta uno snapshot in coda non ancora scritto: conta solo l'ultimo
+        try:
+            _save_queue.get_nowait()
+        except queue.Empty:
+            pass
+        _save_queue.put_nowait(_json_dumps(payload))
+        st.session_state._dirty = False
+        st.session_state._last_flush = time.monotonic()
     except Exception:
         pass
 
+def _append_storico(entry: dict):
+    """Appende un acquisto al sidecar JSONL: O(1 riga) invece di riscrivere
+    l'intero storico dentro lo snapshot."""
+    try:
+        with open(STORICO_PATH, "ab") as fh:
+            fh.write(_json_dumps(entry) + b"\n")
+    except Exception:
+        pass
+
+def save_state():
+    """Segna lo stato come da salvare; la scrittura su disco è debounced in
+    maybe_flush_state() così le raffiche di click in asta pagano un solo write."""
+    st.session_state._dirty = True
+
+def maybe_flush_state(min_interval: float = 1.0):
+    if not st.session_state.get("_dirty"):
+        return
+    if time.monotonic() - st.session_state.get("_last_flush", 0.0) >= min_interval:
+        _save_state_now()
+
 def load_state():
     try:
         if PERSIST_PATH.exists():
-            data = json.loads(PERSIST_PATH.read_text(encoding="utf-8"))
+            # bytes diretti: orjson (e json.loads) parsano UTF-8 senza il passaggio str
+            data = _json_loads(PERSIST_PATH.read_bytes())
             st.session_state.settings = data.get("settings", SETTINGS.copy())
             st.session_state.settings.setdefault("spending_targets", {"P": 0.10, "D": 0.20, "C": 0.30, "A": 0.40})
             st.session_state.squadre = [Squadra.from_dict(d) for d in data.get("squadre", [])]
-            st.session_state.storico_acquisti = data.get("storico", [])
+            # storico dal sidecar JSONL; la chiave "storico" nello snapshot è
+            # il formato legacy e resta come fallback
+            storico = data.get("storico", [])
+            try:
+                if STORICO_PATH.exists():
+                    storico = [
+                        _json_loads(line)
+                        for line in STORICO_PATH.read_bytes().splitlines()
+                        if line.strip()
+                    ]
+                elif storico:
+                    # migrazione una-tantum: semina il sidecar con lo storico
+                    # legacy prima che il prossimo save riscriva lo snapshot
+                    # senza la chiave "storico"
+                    with open(STORICO_PATH, "ab") as fh:
+                        fh.writelines(_json_dumps(e) + b"\n" for e in storico)
+            except Exception:
+                pass
+            st.session_state.storico_acquisti = storico
             st.session_state.my_team_idx = data.get("my_team_idx", 0)
             st.session_state.user_team_idx = data.get("user_team_idx", st.session_state.my_team_idx)
             return True
@@ -241,17 +390,22 @@ def load_state():
 # ===============================
 # STATO INIZIALE (bootstrap una sola volta)
 # ===============================
+def _make_default_squadre(num: int, crediti: int) -> List[Squadra]:
+    """Factory delle squadre di default. Niente cache_resource: le Squadra sono
+    mutabili e una cache le farebbe condividere (alias) tra sessioni."""
+    return [
+        Squadra("Robin Hood Miami" if i == 0 else f"Squadra {i+1}", crediti)
+        for i in range(num)
+    ]
+
 if "_boot" not in st.session_state:
     loaded = load_state()
     if not loaded:
         st.session_state.settings = SETTINGS.copy()
-        def _init_default_squadre() -> List[Squadra]:
-            arr = []
-            for i in range(st.session_state.settings["num_squadre"]):
-                nome = "Robin Hood Miami" if i == 0 else f"Squadra {i+1}"
-                arr.append(Squadra(nome, st.session_state.settings["crediti"]))
-            return arr
-        st.session_state.squadre = _init_default_squadre()
+        st.session_state.squadre = _make_default_squadre(
+            st.session_state.settings["num_squadre"],
+            st.session_state.settings["crediti"],
+        )
         st.session_state.storico_acquisti = []
         default_idx = 0
         for i, t in enumerate(st.session_state.squadre):
@@ -270,32 +424,49 @@ if "_boot" not in st.session_state:
             nome = "Robin Hood Miami" if i == 0 else f"Squadra {i+1}"
             st.session_state.squadre.append(Squadra(nome, st.session_state.settings["crediti"]))
         save_state()
+    # Nonce per sessione, non 0: le cache @st.cache_data sono globali di
+    # processo e una sessione nuova che ripartisse da 0 leggerebbe le entry
+    # (taken set, sidebar, export, tabella a chiamata) cachate dalla sessione
+    # precedente alle versioni 0..N — lega vecchia di N acquisti.
+    st.session_state.state_version = time.time_ns()
+    # Indice incrementale dei nomi già assegnati: membership O(1) in aggiungi_giocatore
+    st.session_state.names_index = {
+        nome for t in st.session_state.squadre for r in RUOLI for nome in t.rosa[r]
+    }
+    # Lista nomi per i selectbox: ricostruita solo alla rinomina, non a ogni rerun
+    st.session_state.team_names = [t.nome for t in st.session_state.squadre]
     st.session_state._boot = True
 
 # ===============================
 # FUNZIONI LEGA
 # ===============================
 def quote_rimaste(team: Squadra) -> Dict[str, int]:
-    return {r: st.session_state.settings["quote_rosa"][r] - len(team.rosa[r]) for r in RUOLI}
+    quote = st.session_state.settings["quote_rosa"]
+    rosa = team.rosa
+    return {r: quote[r] - len(rosa[r]) for r in RUOLI}
 
 def rosa_completa(team: Squadra) -> bool:
-    return all(
-        len(team.rosa[r]) >= st.session_state.settings["quote_rosa"][r]
-        for r in RUOLI
-    )  # <-- chiudi con ")"
+    quote = st.session_state.settings["quote_rosa"]
+    rosa = team.rosa
+    return all(len(rosa[r]) >= quote[r] for r in RUOLI)
 
 def lega_completa() -> bool:
     return all(rosa_completa(t) for t in st.session_state.squadre)
 
 def crediti_rimasti(team: Squadra) -> int:
-    spesi = sum(g.prezzo for r in RUOLI for g in team.rosa[r])
-    return team.budget - spesi
+    return team.budget - team.spesi
 
 def elenco_giocatori_global() -> List[str]:
-    return [g.nome for team in st.session_state.squadre for r in RUOLI for g in team.rosa[r]]
+    return list(st.session_state.names_index)
+
+@st.cache_data(show_spinner=False)
+def _taken_set(version: int) -> frozenset:
+    """Nomi già assegnati normalizzati (strip+upper). Chiave state_version:
+    si ricalcola solo quando una rosa viene mutata, non a ogni rerun."""
+    return frozenset(n.strip().upper() for n in st.session_state.names_index)
 
 def spesa_per_ruolo(team: Squadra) -> Dict[str, int]:
-    return {r: sum(g.prezzo for g in team.rosa[r]) for r in RUOLI}
+    return dict(team.spesa)
 
 def target_per_ruolo(team: Squadra) -> Dict[str, int]:
     perc = st.session_state.settings.get("spending_targets", {"P": 0.10, "D": 0.20, "C": 0.30, "A": 0.40})
@@ -308,9 +479,10 @@ def target_per_ruolo_dynamic(team: Squadra) -> Dict[str, int]:
     - Budget residuo redistribuito tra reparti NON completi
       in proporzione ai pesi originali (10/20/30/40) normalizzati.
     """
-    perc = st.session_state.settings.get("spending_targets", {"P": 0.10, "D": 0.20, "C": 0.30, "A": 0.40})
+    settings = st.session_state.settings  # bind locale: un solo accesso al proxy
+    perc = settings.get("spending_targets", {"P": 0.10, "D": 0.20, "C": 0.30, "A": 0.40})
     spent = spesa_per_ruolo(team)
-    quota = st.session_state.settings["quote_rosa"]
+    quota = settings["quote_rosa"]
     completed = [r for r in RUOLI if len(team.rosa[r]) >= quota[r]]
     if not completed:
         return target_per_ruolo(team)
@@ -333,14 +505,13 @@ def target_per_ruolo_dynamic(team: Squadra) -> Dict[str, int]:
     else:
         weights = {r: (perc.get(r, 0.0)/total_w) for r in remaining_roles}
 
-    acc = 0
-    for i, r in enumerate(remaining_roles):
-        if i < len(remaining_roles)-1:
-            val = int(round(remaining_pool * weights[r]))
-            t[r] = val
-            acc += val
-        else:
-            t[r] = int(remaining_pool - acc)
+    # Riparto in un colpo solo: round vettoriale + correzione sull'ultimo
+    # ruolo, che assorbe il resto e preserva l'invariante di budget esatto.
+    w = np.array([weights[r] for r in remaining_roles])
+    vals = np.rint(remaining_pool * w).astype(np.int64)
+    vals[-1] += remaining_pool - vals.sum()
+    for r, v in zip(remaining_roles, vals):
+        t[r] = int(v)
 
     diff = int(team.budget - sum(t.values()))
     if diff != 0:
@@ -349,78 +520,242 @@ def target_per_ruolo_dynamic(team: Squadra) -> Dict[str, int]:
             break
     return t
 
+def _bump_state_version():
+    """Contatore monotono di versione dello stato: invalida le cache keyed su di esso."""
+    st.session_state.state_version = st.session_state.get("state_version", 0) + 1
+
 def aggiungi_giocatore(team: Squadra, nome: str, ruolo: str, prezzo: int) -> bool:
+    ss = st.session_state  # bind locale: il proxy si paga una volta sola
     if not nome.strip() or ruolo not in RUOLI or prezzo < 0:
         return False
-    if st.session_state.settings["no_doppioni"] and nome in elenco_giocatori_global():
+    if ss.settings["no_doppioni"] and nome.strip() in ss.names_index:
         return False
     if quote_rimaste(team)[ruolo] <= 0:
         return False
     if crediti_rimasti(team) < prezzo:
         return False
-    team.rosa[ruolo].append(Giocatore(nome.strip(), ruolo, prezzo))
-    st.session_state.storico_acquisti.append({
+    nome = nome.strip()
+    team.rosa[ruolo][nome] = Giocatore(nome, ruolo, prezzo)
+    team.spesa[ruolo] += prezzo
+    ss.names_index.add(nome)
+    entry = {
         "squadra": team.nome,
-        "giocatore": nome.strip(),
+        "giocatore": nome,
         "ruolo": ruolo,
         "prezzo": prezzo,
-    })
+    }
+    ss.storico_acquisti.append(entry)
+    _append_storico(entry)
+    _bump_state_version()
     save_state()
     return True
 
 def rimuovi_giocatore(team: Squadra, ruolo: str, giocatore_nome: str) -> bool:
-    elenco = team.rosa[ruolo]
-    for i, g in enumerate(elenco):
-        if g.nome == giocatore_nome:
-            elenco.pop(i)
-            save_state()
-            return True
-    return False
+    g = team.rosa[ruolo].pop(giocatore_nome, None)
+    if g is None:
+        return False
+    team.spesa[ruolo] -= g.prezzo
+    st.session_state.names_index.discard(g.nome)
+    _bump_state_version()
+    save_state()
+    return True
+
+@st.cache_data(show_spinner=False)
+def _build_export_csvs(version: int):
+    """Costruisce i CSV per LegheFantacalcio; cache invalidata da state_version."""
+    rows = []
+    missing = []  # giocatori senza Id nel file 2
+    for team in st.session_state.squadre:
+        for r in RUOLI:
+            for g in team.rosa[r].values():
+                pid = get_player_id(r, g.nome)
+                if pid is not None:
+                    rows.append({"squadra": team.nome, "id_giocatore": pid, "crediti": int(g.prezzo)})
+                else:
+                    missing.append({"squadra": team.nome, "ruolo": r, "giocatore": g.nome, "crediti": int(g.prezzo)})
+    csv_rose = ""
+    if rows:
+        buf = io.StringIO()
+        pd.DataFrame(rows, columns=["squadra","id_giocatore","crediti"]).to_csv(buf, index=False, sep=';')
+        csv_rose = buf.getvalue()
+    csv_missing = ""
+    if missing:
+        buf2 = io.StringIO()
+        pd.DataFrame(missing).to_csv(buf2, index=False, sep=';')
+        csv_missing = buf2.getvalue()
+    return csv_rose, csv_missing, len(missing)
+
+@st.cache_data(show_spinner=False)
+def _build_binary_snapshot(version: int) -> bytes:
+    """Snapshot msgpack dello stato lega (stesso payload di save_state)."""
+    payload = {
+        "settings": st.session_state.get("settings", SETTINGS.copy()),
+        "squadre": [s.to_dict() for s in st.session_state.get("squadre", [])],
+        "storico": st.session_state.get("storico_acquisti", []),
+        "my_team_idx": st.session_state.get("my_team_idx", 0),
+        "user_team_idx": st.session_state.get("user_team_idx", st.session_state.get("my_team_idx", 0)),
+    }
+    return msgpack.packb(payload, use_bin_type=True)
 
 # ===============================
 # FUNZIONI DATI GDRIVE (file ruolo P/D/C/A)
 # ===============================
-@st.cache_data(show_spinner=False)
+CACHE_DIR = Path(".cache")
+
+def _cache_fresh(path: Path, max_age: float = SHEET_TTL) -> bool:
+    """True se la copia su disco esiste ed è più giovane di max_age secondi.
+    Le copie scadute vengono ignorate (e poi sovrascritte dal nuovo download),
+    così il TTL vale anche oltre i riavvii del processo."""
+    try:
+        return path.exists() and (time.time() - path.stat().st_mtime) < max_age
+    except Exception:
+        return False
+
+def _download_drive_file(file_id: str) -> bytes:
+    """Scarica un file da Drive con una Session (keep-alive) gestendo la pagina
+    di conferma virus-scan che Drive restituisce per i file grandi — il path
+    urllib di pandas la ignorerebbe salvando l'HTML di avviso."""
+    url = f"https://drive.google.com/uc?export=download&id={file_id}"
+    sess = requests.Session()
+    r = sess.get(url, stream=True, timeout=30)
+    r.raise_for_status()
+    token = next((v for k, v in r.cookies.items() if k.startswith("download_warning")), None)
+    if token:
+        r = sess.get(url, params={"confirm": token}, stream=True, timeout=30)
+        r.raise_for_status()
+    return r.content
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def _drive_xlsx_bytes(file_id: str) -> bytes:
+    """Byte del workbook, con copia su disco in .cache/ per i cold start."""
+    cache_path = CACHE_DIR / f"{file_id}.xlsx"
+    try:
+        if _cache_fresh(cache_path):
+            return cache_path.read_bytes()
+    except Exception:
+        pass
+    data = _download_drive_file(file_id)
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        cache_path.write_bytes(data)
+    except Exception:
+        pass
+    return data
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def _open_workbook() -> pd.ExcelFile:
+    """Scarica il workbook una sola volta e riusa lo stesso handle per tutti i
+    fogli P/D/C/A (una HTTP GET e un'apertura zip invece di quattro)."""
+    buf = io.BytesIO(_drive_xlsx_bytes(FILE_ID))
+    try:
+        # calamine (Rust): parsing 5-20x più veloce e niente stili/formule
+        return pd.ExcelFile(buf, engine="calamine")
+    except Exception:
+        buf.seek(0)
+        return pd.ExcelFile(buf, engine="openpyxl")
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
 def load_sheet_from_drive(sheet_name: str) -> pd.DataFrame:
+    # cache_resource: un solo DataFrame per foglio, restituito per riferimento
+    # (niente copia pickle a ogni rerun). I chiamanti lo trattano come
+    # read-only: chi deve modificarlo fa prima una copy().
+    # Cache su disco in Parquet: il workbook cambia di rado e rileggere un
+    # Parquet colonnare è ~10-50x più veloce del parsing XML di openpyxl.
+    cache_path = CACHE_DIR / f"{FILE_ID}_{sheet_name}.parquet"
     try:
-        df = pd.read_excel(DRIVE_XLSX_URL, sheet_name=sheet_name)
-        return df
+        if _cache_fresh(cache_path):
+            return _finalize_sheet(pd.read_parquet(cache_path))
+    except Exception:
+        pass  # cache corrotta/illeggibile: si riscarica
+    try:
+        df = _open_workbook().parse(sheet_name)
     except ImportError:
         raise RuntimeError("Per leggere file Excel è necessario installare 'openpyxl' (pip install openpyxl)")
     except Exception as e:
         raise RuntimeError(f"Errore lettura file Drive: {e}")
-
-@st.cache_data(show_spinner=False)
-def rotate_from_letter(df: pd.DataFrame, col_name: str, letter: str) -> pd.DataFrame:
-    if col_name not in df.columns:
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        df.to_parquet(cache_path, compression="zstd")
+    except Exception:
+        pass  # pyarrow assente o colonne non serializzabili: si continua senza cache
+    return _finalize_sheet(df)
+
+def _finalize_sheet(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalizzazioni una-tantum sul foglio appena caricato: nomi ripuliti e
+    mappa colonna-minuscola in attrs, così i rerun non le rifanno."""
+    if NAME_COL in df.columns:
+        df[NAME_COL] = df[NAME_COL].astype(str).fillna("").str.strip()
+        # name_key vettoriale precalcolata: i join col file 2 leggono la
+        # colonna invece di rifare la normalizzazione per riga a ogni rerun
+        df["_key"] = (
+            df[NAME_COL]
+            .str.normalize("NFKD")
+            .str.encode("ascii", "ignore")
+            .str.decode("ascii")
+            .str.lower()
+            .str.replace(r"[^a-z0-9]", "", regex=True)
+        )
+    df.attrs["cols_lower"] = {c.lower(): c for c in df.columns}
+    # Slot numerico precalcolato: la colonna è statica per foglio, inutile
+    # rifare l'estrazione regex a valle a ogni rerun
+    slot_c = df.attrs["cols_lower"].get("slot")
+    if slot_c:
+        df["_slot_num"] = (
+            pd.to_numeric(df[slot_c].astype(str).str.extract(r"(\d+)", expand=False),
+                          errors="coerce")
+            .fillna(9999)
+            .astype("int32")
+        )
+    return df
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def _base_sorted(sheet_name: str) -> pd.DataFrame:
+    """Foglio ordinato alfabeticamente per nome. cache_resource: restituisce lo
+    stesso oggetto per riferimento (niente pickle per accesso) — da trattare
+    come read-only a valle."""
+    df = load_sheet_from_drive(sheet_name)
+    if NAME_COL not in df.columns:
         return df
-    base = df.sort_values(col_name, key=lambda s: s.astype(str).str.upper()).reset_index(drop=True)
+    base = df.sort_values(NAME_COL, key=lambda s: s.astype(str).str.upper()).reset_index(drop=True)
+    # iniziali precalcolate come categorical: la rotazione per lettera lavora
+    # sui codici interi invece che sulle stringhe
+    base.attrs["_init"] = base[NAME_COL].astype(str).str.strip().str.upper().str[0].astype("category")
+    return base
+
+@st.cache_data(ttl=SHEET_TTL, show_spinner=False)
+def rotate_from_letter(sheet_name: str, col_name: str, letter: str) -> pd.DataFrame:
+    """Vista del foglio ruotata sulla lettera estratta. La chiave di cache è
+    (foglio, colonna, lettera): due stringhe, niente hashing del DataFrame."""
+    base = _base_sorted(sheet_name)
+    if col_name not in base.columns:
+        return base
     if not letter or len(letter) != 1 or not letter.isalpha():
         return base
-    initials = base[col_name].astype(str).str.strip().str.upper().str[0]
+    initials = base.attrs.get("_init")
+    if initials is None:
+        initials = base[col_name].astype(str).str.strip().str.upper().str[0].astype("category")
     letter = letter.upper()
-    alphabet = [chr(c) for c in range(ord('A'), ord('Z')+1)]
-    order = alphabet[alphabet.index(letter):] + alphabet[:alphabet.index(letter)]
-    frames = [base[initials == ch] for ch in order]
-    rotated = pd.concat(frames, ignore_index=True)
-    rotated = pd.concat([rotated, base[~initials.isin(alphabet)]], ignore_index=True)
-    return rotated
+    # rango rotazionale 0..25 (iniziali non alfabetiche in coda = 26) calcolato
+    # sulle sole categorie (~26) e proiettato sui codici interi con np.take,
+    # poi un unico argsort stabile: niente 26 maschere booleane né pd.concat
+    rank_map = {chr(c): (c - ord(letter)) % 26 for c in range(ord('A'), ord('Z') + 1)}
+    cats = initials.cat.categories
+    cat_rank = np.fromiter((rank_map.get(c, 26) for c in cats), dtype=np.int8, count=len(cats))
+    codes = initials.cat.codes.to_numpy()
+    rank = np.where(codes >= 0, cat_rank.take(np.maximum(codes, 0)), np.int8(26))
+    order = np.argsort(rank, kind="stable")
+    return base.iloc[order].reset_index(drop=True)
 
 # Helper: parse range stimato (es. '32-48' → (32,48))
+_INT_RE = re.compile(r"\d+")
+
 def parse_pfcrange_cell(val):
     try:
         if val is None:
             return (None, None)
-        s = str(val)
-        nums, buf = [], ''
-        for ch in s:
-            if ch.isdigit():
-                buf += ch
-            else:
-                if buf:
-                    nums.append(int(buf)); buf=''
-        if buf:
-            nums.append(int(buf))
+        # regex compilata a livello modulo: la scansione gira nel motore sre
+        # in C invece del loop Python carattere per carattere
+        nums = [int(x) for x in _INT_RE.findall(str(val))]
         if len(nums) >= 2:
             a,b = nums[0], nums[1]
             return (a,b) if a<=b else (b,a)
@@ -433,25 +768,28 @@ def parse_pfcrange_cell(val):
 # ===============================
 # LOOKUP SLOT PER GIOCATORE (da fogli Excel ruolo)
 # ===============================
-@st.cache_data(show_spinner=False)
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
 def build_slot_lookup() -> Dict[str, str]:
+    # cache_resource: il dict (qualche migliaio di voci, statico) torna per
+    # riferimento senza il round-trip pickle di cache_data a ogni accesso
     mapping: Dict[str, str] = {}
     for sheet in RUOLI:
         try:
             df = load_sheet_from_drive(sheet)
             if df is None or df.empty:
                 continue
-            cols_lower = {c.lower(): c for c in df.columns}
+            cols_lower = df.attrs.get("cols_lower") or {c.lower(): c for c in df.columns}
             name_col = cols_lower.get('name')
             slot_col = cols_lower.get('slot')
             if not name_col or not slot_col:
                 continue
-            for _, row in df[[name_col, slot_col]].dropna(subset=[name_col]).iterrows():
-                name_str = norm_name(row[name_col])
-                slot_val = row[slot_col]
-                if pd.isna(slot_val) or str(slot_val).strip() == "":
-                    continue
-                mapping[f"{sheet}|{name_str}"] = str(slot_val)
+            # colonne intere, niente iterrows: una Series per riga solo per
+            # leggere due campi è puro overhead Python
+            sub = df[[name_col, slot_col]].dropna(subset=[name_col, slot_col])
+            slots = sub[slot_col].astype(str)
+            keep = slots.str.strip().ne("").to_numpy()
+            keys = (sheet + "|" + norm_name_series(sub[name_col])).to_numpy()[keep]
+            mapping.update(zip(keys, slots.to_numpy()[keep]))
         except Exception:
             continue
     return mapping
@@ -465,17 +803,25 @@ def get_slot_for(nome: str, ruolo: str):
 # ===============================
 # DATI EXTRA (file 'Tutti'): Qt.A, FVM
 # ===============================
-@st.cache_data(show_spinner=False)
+@st.cache_data(ttl=SHEET_TTL, show_spinner=False)
 def load_all_extra_df() -> pd.DataFrame:
     try:
-        df = pd.read_excel(DRIVE2_XLSX_URL, sheet_name=SHEET2_NAME)
+        # stesso percorso del file 1: gestione del confirm-token virus-scan
+        # di Drive (pd.read_excel via urllib salverebbe l'HTML di avviso)
+        # e copia su disco in .cache/
+        buf = io.BytesIO(_drive_xlsx_bytes(FILE2_ID))
+        try:
+            df = pd.read_excel(buf, sheet_name=SHEET2_NAME, engine="calamine")
+        except Exception:
+            buf.seek(0)
+            df = pd.read_excel(buf, sheet_name=SHEET2_NAME)
         return df
     except ImportError:
         raise RuntimeError("Per leggere file Excel è necessario installare 'openpyxl' (pip install openpyxl)")
     except Exception as e:
         raise RuntimeError(f"Errore lettura file Drive (Tutti): {e}")
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
 def build_extra_index() -> Dict[str, Dict[str, object]]:
     """Crea mapping dal file 2 (sheet 'Tutti') usando **esattamente**:
     - Ruolo dalla colonna "R" (prima lettera)
@@ -501,20 +847,37 @@ def build_extra_index() -> Dict[str, Dict[str, object]]:
             return mapping
         name_keys = df[nome_col].astype(str).map(name_key)
         role_first = df[ruolo_col].astype(str).str.strip().str.upper().str[:1]
-        for i, row in df.iterrows():
-            r = role_first.iloc[i]
-            if r not in RUOLI:
-                continue
-            key = f"{r}|{name_keys.iloc[i]}"
-            mapping[key] = {
-                "Qt.A": (row[qta_col] if qta_col in df.columns else None) if qta_col else None,
-                "FVM": (row[fvm_col] if fvm_col in df.columns else None) if fvm_col else None,
-            }
+        # maschera vettoriale + zip su array: niente iterrows né Series per riga
+        mask = role_first.isin(RUOLI).to_numpy()
+        keys = (role_first + "|" + name_keys).to_numpy()[mask]
+        n = len(keys)
+        qta = df[qta_col].to_numpy()[mask] if qta_col else [None] * n
+        fvm = df[fvm_col].to_numpy()[mask] if fvm_col else [None] * n
+        mapping = {k: {"Qt.A": q, "FVM": f} for k, q, f in zip(keys, qta, fvm)}
         return mapping
     except Exception:
         return mapping
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def _extra_metric_maps():
+    """Qt.A e FVM pre-coerciti a float, per ruolo: ({r: {key: qta}}, {r: {key: fvm}}).
+    Le .map(dict) a valle girano nel percorso C di pandas, senza try/except
+    per riga."""
+    qta: Dict[str, Dict[str, float]] = {r: {} for r in RUOLI}
+    fvm: Dict[str, Dict[str, float]] = {r: {} for r in RUOLI}
+    for key, rec in build_extra_index().items():
+        r, _, k = key.partition("|")
+        try:
+            qta[r][k] = float(rec.get("Qt.A"))
+        except Exception:
+            pass
+        try:
+            fvm[r][k] = float(rec.get("FVM"))
+        except Exception:
+            pass
+    return qta, fvm
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
 def build_id_index() -> Dict[str, int]:
     """
     Crea mapping dal file 2 (sheet 'Tutti'):
@@ -585,8 +948,7 @@ def _clamp01(x: float) -> float:
 def _lerp(a: int, b: int, t: float) -> int:
     return int(round(a + (b - a) * t))
 
-def ratio_color_hex(r: float) -> str:
-    r = _clamp01(r)
+def _ratio_hex(r: float) -> str:
     g_col = (0, 170, 0)   # verde
     r_col = (220, 0, 0)   # rosso
     rr = _lerp(g_col[0], r_col[0], r)
@@ -594,6 +956,13 @@ def ratio_color_hex(r: float) -> str:
     bb = _lerp(g_col[2], r_col[2], r)
     return f"#{rr:02X}{gg:02X}{bb:02X}"
 
+# 101 valori distinti dopo il clamp a percentuale intera: palette precalcolata
+# a import time, il chiamante fa solo un'indicizzazione
+_RATIO_PALETTE = tuple(_ratio_hex(i / 100) for i in range(101))
+
+def ratio_color_hex(r: float) -> str:
+    return _RATIO_PALETTE[int(round(_clamp01(r) * 100))]
+
 # ===============================
 # PROBABILI FORMAZIONI – Fantacalcio.it
 # ===============================
@@ -759,64 +1128,86 @@ def apply_auto_refresh():
         from streamlit_autorefresh import st_autorefresh  # type: ignore
         st_autorefresh(interval=interval_ms, key="auto_refresh")
     except Exception:
-        st.markdown(
-            f"<script>setTimeout(function(){{window.location.reload();}}, {interval_ms});</script>",
-            unsafe_allow_html=True,
-        )
+        # niente fallback con reload completo: un refresh di pagina butta via
+        # cache e stato client ed è molto più costoso di un rerun Streamlit.
+        # Senza il componente, meglio nessun auto-refresh e un avviso discreto.
+        st.caption("Auto-refresh non attivo: installa 'streamlit-autorefresh'.")
 
 apply_auto_refresh()
 
 # ===============================
 # UI: SIDEBAR – RIEPILOGO (solo Terzetto Scherzetto)
 # ===============================
+@st.cache_data(show_spinner=False)
+def _sidebar_cards_html(version: int, team_idx: int) -> str:
+    """HTML delle card per reparto. Chiave (state_version, squadra): i tick di
+    auto-refresh senza mutazioni riusano la stringa già composta, senza rifare
+    colori, barre e lookup slot per ogni giocatore."""
+    team = st.session_state.squadre[team_idx]
+    spent_map = spesa_per_ruolo(team)
+    targ_map = target_per_ruolo_dynamic(team)
+    quote_map = st.session_state.settings["quote_rosa"]
+    # una sola risoluzione della lookup slot per tutto il render
+    slot_map = build_slot_lookup()
+    parts = []
+    for r, label in ROLE_SECTIONS:
+        count = len(team.rosa[r])
+        quota = quote_map[r]
+        s = spent_map.get(r, 0)
+        t = max(targ_map.get(r, 0), 1)
+        ratio = s / t
+        pct_int = int(round(100*ratio))
+        pct_color = ratio_color_hex(min(ratio,1.0))
+        badge_html = f" <span style='background:#DC2626;color:#fff;border-radius:12px;padding:2px 6px;margin-left:6px;'>+{s - t}</span>" if s > t else ""
+        header_html = f"<strong>{label} ({count}/{quota}) — {s}/{t} (<span style='color:{pct_color}'>{pct_int}%</span>)</strong>{badge_html}"
+
+        items = []
+        for g in team.rosa[r].values():
+            _slot = slot_map.get(f"{r}|{norm_name(g.nome)}")
+            if _slot:
+                items.append(f"{g.nome} — Slot: {_slot} ({g.prezzo})")
+            else:
+                items.append(f"{g.nome} ({g.prezzo})")
+        items_html = "<ul style='margin:6px 0 0 18px;padding:0;'><li>" + "</li><li>".join(items) + "</li></ul>" if items else "<em>nessuno</em>"
+
+        bar_color = ratio_color_hex(min(ratio,1.0))
+        width_pct = int(round(min(ratio,1.0)*100))
+        border_col = "#FCA5A5" if s > t else "#E5E7EB"
+        bg_col = "#FFF6F6" if s > t else "transparent"
+
+        parts.append(f"""
+        <div style='border:1px solid {border_col}; padding:8px 10px; border-radius:10px; margin-bottom:10px; background:{bg_col};'>
+          {header_html}
+          <div style='margin-top:6px;background:#eee;width:100%;height:8px;border-radius:6px;overflow:hidden;'>
+            <div style='width:{width_pct}%;height:100%;background:{bar_color};'></div>
+          </div>
+          <div style='margin-top:6px;'>{items_html}</div>
+        </div>
+        """)
+    return "".join(parts)
+
+# st.fragment (Streamlit >= 1.33): i widget interni rieseguono solo il frammento,
+# non l'intero script; fallback no-op su versioni precedenti.
+_fragment = getattr(st, "fragment", None) or (lambda f: f)
+
+# Niente fragment qui: st.sidebar dentro un frammento non è supportato e,
+# senza widget interni, il blocco non riceverebbe comunque rerun isolati.
+# Il risparmio richiesto lo dà l'HTML cached di _sidebar_cards_html.
 with st.sidebar:
+    squadre = st.session_state.squadre  # bind locale: evita il proxy su ogni accesso
     idx = st.session_state.get("user_team_idx", 0)
-    idx = min(idx, len(st.session_state.squadre)-1)
-    my_team = st.session_state.squadre[idx] if st.session_state.squadre else None
+    idx = min(idx, len(squadre)-1)
+    my_team = squadre[idx] if squadre else None
 
     st.title(f"📋 {my_team.nome if my_team else 'Rosa'}")
 
     if my_team:
         st.metric("Crediti rimasti", crediti_rimasti(my_team))
         st.markdown("---")
-        spent_map = spesa_per_ruolo(my_team)
-        # 🔁 usa TARGET DINAMICI
-        targ_map = target_per_ruolo_dynamic(my_team)
-        for r, label in [("P","Portieri"),("D","Difensori"),("C","Centrocampisti"),("A","Attaccanti")]:
-            count = len(my_team.rosa[r])
-            quota = st.session_state.settings['quote_rosa'][r]
-            s = spent_map.get(r, 0)
-            t = max(targ_map.get(r, 0), 1)
-            ratio = s / t
-            pct_int = int(round(100*ratio))
-            pct_color = ratio_color_hex(min(ratio,1.0))
-            badge_html = f" <span style='background:#DC2626;color:#fff;border-radius:12px;padding:2px 6px;margin-left:6px;'>+{s - t}</span>" if s > t else ""
-            header_html = f"<strong>{label} ({count}/{quota}) — {s}/{t} (<span style='color:{pct_color}'>{pct_int}%</span>)</strong>{badge_html}"
-
-            items = []
-            for g in my_team.rosa[r]:
-                _slot = get_slot_for(g.nome, r)
-                if _slot:
-                    items.append(f"{g.nome} — Slot: {_slot} ({g.prezzo})")
-                else:
-                    items.append(f"{g.nome} ({g.prezzo})")
-            items_html = "<ul style='margin:6px 0 0 18px;padding:0;'>" + "".join(f"<li>{n}</li>" for n in items) + "</ul>" if items else "<em>nessuno</em>"
-
-            bar_color = ratio_color_hex(min(ratio,1.0))
-            width_pct = int(round(min(ratio,1.0)*100))
-            border_col = "#FCA5A5" if s > t else "#E5E7EB"
-            bg_col = "#FFF6F6" if s > t else "transparent"
-
-            wrapper_html = f"""
-            <div style='border:1px solid {border_col}; padding:8px 10px; border-radius:10px; margin-bottom:10px; background:{bg_col};'>
-              {header_html}
-              <div style='margin-top:6px;background:#eee;width:100%;height:8px;border-radius:6px;overflow:hidden;'>
-                <div style='width:{width_pct}%;height:100%;background:{bar_color};'></div>
-              </div>
-              <div style='margin-top:6px;'>{items_html}</div>
-            </div>
-            """
-            st.markdown(wrapper_html, unsafe_allow_html=True)
+        st.markdown(
+            _sidebar_cards_html(st.session_state.state_version, idx),
+            unsafe_allow_html=True,
+        )
 
         st.markdown("---")
         spesi = my_team.budget - crediti_rimasti(my_team)
@@ -835,13 +1226,15 @@ tab_asta, tab_call, tab_riepilogo, tab_nomi = st.tabs([
 # ===============================
 # TAB: RIEPILOGO (tutte le squadre) — con pulsante Rimuovi
 # ===============================
-with tab_riepilogo:
-    for t_idx, team in enumerate(st.session_state.squadre):
+@_fragment
+def _render_riepilogo():
+    squadre = st.session_state.squadre
+    for t_idx, team in enumerate(squadre):
         with st.expander(f"{team.nome} – Crediti rimasti: {crediti_rimasti(team)}", expanded=False):
-            for r, label in [("P","Portieri"),("D","Difensori"),("C","Centrocampisti"),("A","Attaccanti")]:
+            for r, label in ROLE_SECTIONS:
                 st.markdown(f"**{label}**")
                 if team.rosa[r]:
-                    for i, g in enumerate(team.rosa[r]):
+                    for i, g in enumerate(team.rosa[r].values()):
                         c1, c2, c3 = st.columns([6,2,1])
                         c1.write(g.nome)
                         c2.write(f"{g.prezzo} crediti")
@@ -854,65 +1247,117 @@ with tab_riepilogo:
                 else:
                     st.write("_nessuno_")
 
+with tab_riepilogo:
+    _render_riepilogo()
+
 
     st.markdown("---")
     st.subheader("📦 Esporta rose per LegheFantacalcio (senza vincoli)")
-    
-    # Costruisce SEMPRE il CSV: squadra;id_giocatore;crediti
-    rows = []
-    missing = []  # giocatori senza Id nel file 2
-    
-    for team in st.session_state.squadre:
-        for r in RUOLI:
-            for g in team.rosa[r]:
-                pid = get_player_id(r, g.nome)
-                if pid is not None:
-                    rows.append({"squadra": team.nome, "id_giocatore": pid, "crediti": int(g.prezzo)})
-                else:
-                    missing.append({"squadra": team.nome, "ruolo": r, "giocatore": g.nome, "crediti": int(g.prezzo)})
-    
-    if rows:
-        buf = io.StringIO()
-        pd.DataFrame(rows, columns=["squadra","id_giocatore","crediti"]).to_csv(buf, index=False, sep=';')
+
+    # CSV squadra;id_giocatore;crediti — ricostruito solo quando lo stato cambia
+    csv_rose, csv_missing, n_missing = _build_export_csvs(st.session_state.state_version)
+
+    if csv_rose:
         st.download_button(
             "⬇️ Scarica CSV – formato: squadra;id_giocatore;crediti",
-            data=buf.getvalue().encode("utf-8"),
+            data=csv_rose.encode("utf-8"),
             file_name="rose_leghefantacalcio.csv",
             mime="text/csv"
         )
     else:
         st.info("Nessun giocatore assegnato ancora: aggiungi almeno un acquisto per generare il CSV.")
-    
+
     # Report facoltativo dei giocatori senza Id
-    if missing:
-        st.warning(f"{len(missing)} giocatori non hanno trovato l'Id nel file 2 (sheet 'Tutti').")
-        buf2 = io.StringIO()
-        pd.DataFrame(missing).to_csv(buf2, index=False, sep=';')
+    if n_missing:
+        st.warning(f"{n_missing} giocatori non hanno trovato l'Id nel file 2 (sheet 'Tutti').")
         st.download_button(
             "⬇️ Scarica elenco SENZA Id (per verifica)",
-            data=buf2.getvalue().encode("utf-8"),
+            data=csv_missing.encode("utf-8"),
             file_name="mancano_id.csv",
             mime="text/csv"
         )
 
+    # Snapshot binario (msgpack): backup compatto/veloce dello stato lega
+    if msgpack is not None:
+        st.download_button(
+            "⬇️ Scarica snapshot binario (.msgpack)",
+            data=_build_binary_snapshot(st.session_state.state_version),
+            file_name="lega_snapshot.msgpack",
+            mime="application/octet-stream",
+        )
+
 # ===============================
 # TAB: NOMI SQUADRE (rinomina)
 # ===============================
 with tab_nomi:
-    for i, team in enumerate(st.session_state.squadre):
+    squadre = st.session_state.squadre
+    name_to_idx = {n: j for j, n in enumerate(st.session_state.team_names)}
+    for i, team in enumerate(squadre):
         nuovo_nome = st.text_input(f"Nome squadra {i+1}", value=team.nome, key=f"nome_{i}")
         if nuovo_nome.strip() and nuovo_nome != team.nome:
-            altri_nomi = {t.nome for j, t in enumerate(st.session_state.squadre) if j != i}
-            if nuovo_nome in altri_nomi:
+            if nuovo_nome in name_to_idx and name_to_idx[nuovo_nome] != i:
                 st.warning(f"Il nome '{nuovo_nome}' è già in uso.")
             else:
+                name_to_idx.pop(team.nome, None)
                 team.nome = nuovo_nome
+                st.session_state.team_names[i] = nuovo_nome
+                name_to_idx[nuovo_nome] = i
                 st.success(f"Nome aggiornato: {team.nome}")
+                _bump_state_version()
                 save_state()
 
 # ===============================
 # TAB: GIOCATORE A CHIAMATA (Qt.A ≤ X, ordinati Slot↑, Qt.A↓, FVM↓, Nome↑)
 # ===============================
+@st.cache_data(show_spinner=False)
+def _compute_call_table(ruolo: str, qta_max: float, version: int):
+    """Tabella ordinata del giocatore a chiamata. Chiave (ruolo, soglia,
+    state_version): filtro, join e mergesort a 4 chiavi girano solo quando
+    cambia davvero uno degli input, non a ogni tick di widget."""
+    df_raw = load_sheet_from_drive(ruolo)
+    if df_raw.empty or NAME_COL not in df_raw.columns:
+        return None
+    # Escludi già assegnati: stesso frozenset cached del tab Asta. Il filtro
+    # booleano materializza già un frame nuovo: nessun .copy() esplicito.
+    df = df_raw.loc[~df_raw[NAME_COL].str.upper().isin(_taken_set(version))].reset_index(drop=True)
+
+    cols_l = df.attrs.get("cols_lower") or {c.lower(): c for c in df.columns}
+    team_c = cols_l.get('team')
+    slot_c = cols_l.get('slot')
+    range_c = cols_l.get('pfcrange')
+    fm_c = cols_l.get('expectedfantamedia')
+
+    # Join con file 2: Qt.A e FVM (mappe float pre-coercite per ruolo)
+    qta_map, fvm_map = _extra_metric_maps()
+    keys = df["_key"] if "_key" in df.columns else df[NAME_COL].map(name_key)
+    df = df.assign(_QtA=keys.map(qta_map[ruolo]), _FVM=keys.map(fvm_map[ruolo]))
+
+    # Filtro: Qt.A ≤ valore inserito (ignora i NaN). .loc + assign evita il
+    # .copy() integrale (e qualunque SettingWithCopyWarning).
+    df = df.loc[df["_QtA"].notna() & (df["_QtA"] <= float(qta_max))]
+
+    # Ordina: Slot ↑, poi Qt.A ↓, poi FVM ↓, quindi Nome ↑
+    # (_slot_num è precalcolata in _finalize_sheet quando esiste la colonna Slot)
+    df = df.assign(
+        _slot_num=df["_slot_num"] if "_slot_num" in df.columns else 9999,
+        _QtA_sort=pd.to_numeric(df["_QtA"], errors='coerce').fillna(float('-inf')),
+        _FVM_sort=pd.to_numeric(df["_FVM"], errors='coerce').fillna(float('-inf')),
+    )
+    df = df.sort_values(["_slot_num", "_QtA_sort", "_FVM_sort", NAME_COL],
+                        ascending=[True, False, False, True], kind="mergesort")
+
+    # Output: selezione + rename sul frame già ordinato, niente ricostruzione
+    # colonna per colonna di un DataFrame nuovo
+    rename_map = {}
+    if slot_c: rename_map[slot_c] = "Slot"
+    rename_map[NAME_COL] = "Nome"
+    if team_c: rename_map[team_c] = "Squadra"
+    rename_map["_QtA"] = "Qt.A"
+    rename_map["_FVM"] = "FVM"
+    if range_c: rename_map[range_c] = "Range Stimato"
+    if fm_c: rename_map[fm_c] = "Fantamedia Stimata (file1)"
+    return df.loc[:, list(rename_map)].rename(columns=rename_map).reset_index(drop=True)
+
 with tab_call:
     st.subheader("Giocatore a chiamata")
     c1, c2 = st.columns([2,1])
@@ -922,67 +1367,10 @@ with tab_call:
         qta_max = st.number_input("Qt.A massima (≤)", min_value=0, step=1, key="qta_max_call")
 
     try:
-        df_raw = load_sheet_from_drive(ruolo_call)
-        if df_raw.empty or NAME_COL not in df_raw.columns:
+        df_out = _compute_call_table(ruolo_call, float(qta_max), st.session_state.state_version)
+        if df_out is None:
             st.info("Dati non disponibili per questo ruolo.")
         else:
-            df = df_raw.copy()
-            df[NAME_COL] = df[NAME_COL].astype(str).str.strip()
-            # Escludi già assegnati
-            taken = {str(n).strip().upper() for n in elenco_giocatori_global()}
-            df = df[~df[NAME_COL].str.upper().isin(taken)].reset_index(drop=True)
-
-            cols_l = {c.lower(): c for c in df.columns}
-            team_c = cols_l.get('team')
-            slot_c = cols_l.get('slot')
-            range_c = cols_l.get('pfcrange')
-            fm_c = cols_l.get('expectedfantamedia')
-
-            # Join con file 2: Qt.A e FVM
-            idx_extra = build_extra_index()
-            def _get_qta(name: str):
-                rec = idx_extra.get(f"{ruolo_call}|{name_key(name)}")
-                v = rec.get("Qt.A") if rec else None
-                try:
-                    return float(v)
-                except Exception:
-                    return None
-            def _get_fvm(name: str):
-                rec = idx_extra.get(f"{ruolo_call}|{name_key(name)}")
-                v = rec.get("FVM") if rec else None
-                try:
-                    return float(v)
-                except Exception:
-                    return None
-            df["_QtA"] = df[NAME_COL].map(_get_qta)
-            df["_FVM"] = df[NAME_COL].map(_get_fvm)
-
-            # Filtro: Qt.A ≤ valore inserito (ignora i NaN)
-            df = df[df["_QtA"].notna() & (df["_QtA"] <= float(qta_max))].copy()
-
-            # Ordina: Slot ↑, poi Qt.A ↓, poi FVM ↓, quindi Nome ↑
-            if slot_c:
-                df["_slot_num"] = pd.to_numeric(df[slot_c].astype(str).str.extract(r"(\d+)")[0], errors='coerce')
-            else:
-                df["_slot_num"] = pd.NA
-            df["_slot_num"] = df["_slot_num"].fillna(9999)
-
-            df["_QtA_sort"] = pd.to_numeric(df["_QtA"], errors='coerce').fillna(float('-inf'))
-            df["_FVM_sort"] = pd.to_numeric(df["_FVM"], errors='coerce').fillna(float('-inf'))
-            df = df.sort_values(["_slot_num", "_QtA_sort", "_FVM_sort", NAME_COL],
-                                ascending=[True, False, False, True], kind="mergesort")
-
-            # Output columns
-            out_cols = {}
-            if slot_c: out_cols["Slot"] = df[slot_c]
-            out_cols["Nome"] = df[NAME_COL]
-            if team_c: out_cols["Squadra"] = df[team_c]
-            out_cols["Qt.A"] = df["_QtA"]
-            out_cols["FVM"] = df["_FVM"]
-            if range_c: out_cols["Range Stimato"] = df[range_c]
-            if fm_c: out_cols["Fantamedia Stimata (file1)"] = df[fm_c]
-            df_out = pd.DataFrame(out_cols).reset_index(drop=True)
-
             st.caption(f"Trovati {len(df_out)} giocatori per {ruolo_call} con Qt.A ≤ {int(qta_max)}")
             st.dataframe(df_out, use_container_width=True, hide_index=True)
     except Exception as e:
@@ -991,26 +1379,93 @@ with tab_call:
 # ===============================
 # TAB: ASTA – RUOLO & LETTERA + CARD GIOCATORE
 # ===============================
-with tab_asta:
-    col_a, col_b = st.columns([1,1])
-    with col_a:
-        st.subheader("Ruolo in asta")
-        ruolo_asta = st.radio(
-            "Seleziona il ruolo per cui si sta svolgendo l'asta",
-            RUOLI,
-            index=0,
-            horizontal=True,
-            key="ruolo_asta",
-        )
-    with col_b:
-        st.subheader("Lettera estratta")
-        lettera_input = st.text_input(
-            "Inserisci la lettera alfabetica estratta (A–Z)",
-            value=st.session_state.get("lettera_estratta", ""),
-            max_chars=1,
-        )
-        st.session_state["lettera_estratta"] = (lettera_input or "").upper()
+# CSS dei tooltip: costante di modulo, iniettata una volta per render del
+# pannello invece che duplicata in ogni sezione (va riemessa a ogni run,
+# un flag di sessione la farebbe sparire al rerun successivo)
+TOOLTIP_CSS = """
+<style>
+.tooltip-row{position:relative;padding:4px 2px;}
+.tooltip-row .hint{cursor:default;}
+.tooltip-row .tip{visibility:hidden;opacity:0;transition:opacity .15s ease;position:absolute;left:0;top:100%;background:#111;color:#fff;padding:8px 10px;border-radius:8px;z-index:1000;min-width:220px;max-width:420px;box-shadow:0 4px 12px rgba(0,0,0,.2);}
+.tooltip-row:hover .tip{visibility:visible;opacity:1;}
+.tooltip-row .tip ul{margin:6px 0 0 18px;padding:0;max-height:260px;overflow:auto;}
+</style>
+"""
+
+@st.cache_resource(ttl=SHEET_TTL, show_spinner=False)
+def _slot_buckets(sheet_name: str):
+    """Bucket statici per foglio: ordine degli slot e nomi per slot. La colonna
+    Slot è immutabile, quindi groupby e ordinamento girano una volta sola;
+    il percorso caldo si limita a sottrarre gli assegnati."""
+    df = load_sheet_from_drive(sheet_name)
+    cols_lower = df.attrs.get("cols_lower") or {c.lower(): c for c in df.columns}
+    slot_col = cols_lower.get('slot')
+    if not slot_col or NAME_COL not in df.columns:
+        return None
+    sub = df.loc[:, [slot_col, NAME_COL]].dropna(subset=[slot_col, NAME_COL])
+    slots = sub[slot_col].astype(str).str.strip()
+    names_by_slot = sub[NAME_COL].astype(str).groupby(slots).agg(list).to_dict()
+    order = pd.DataFrame({'slot': slots.drop_duplicates()})
+    order['slot_num'] = pd.to_numeric(order['slot'], errors='coerce')
+    order = order.sort_values(['slot_num', 'slot'], na_position='last')
+    return list(order['slot']), names_by_slot
 
+@st.cache_data(show_spinner=False)
+def _slot_availability(sheet_name: str, version: int, q: str):
+    """Disponibilità per slot del ruolo in asta, già filtrata per assegnati e
+    ricerca. Chiave (foglio, state_version, query): i tick senza mutazioni né
+    nuove ricerche riusano il risultato. Senza query lavora sui bucket statici
+    di _slot_buckets (niente groupby per acquisto); con query ricade sul
+    percorso pandas. Restituisce una lista di (slot, conteggio, nomi),
+    None se manca la colonna Slot."""
+    if not q:
+        buckets = _slot_buckets(sheet_name)
+        if buckets is None:
+            return None
+        order, names_by_slot = buckets
+        taken = _taken_set(version)
+        rows = []
+        for val in order:
+            avail = [n for n in names_by_slot.get(val, []) if n.upper() not in taken]
+            if avail:  # come prima: gli slot esauriti non compaiono
+                rows.append((val, len(avail), avail))
+        return rows
+    df = load_sheet_from_drive(sheet_name)
+    cols_lower = df.attrs.get("cols_lower") or {c.lower(): c for c in df.columns}
+    slot_col = cols_lower.get('slot')
+    if not slot_col or NAME_COL not in df.columns:
+        return None
+    mask = ~df[NAME_COL].str.upper().isin(_taken_set(version))
+    if q:
+        # stesso haystack unico del filtro lista (vedi _render_carosello)
+        hay = df[NAME_COL].str.lower()
+        team_c = cols_lower.get('team')
+        if team_c:
+            hay = hay + "|" + df[team_c].astype(str).str.lower()
+        hay = hay + "|" + df[slot_col].astype(str).str.lower()
+        mask &= hay.str.contains(q, regex=False)
+    sub = df.loc[mask, [slot_col, NAME_COL]].dropna(subset=[slot_col, NAME_COL])
+    if sub.empty:
+        return []
+    slots = sub[slot_col].astype(str).str.strip()
+    # agg(list) nel percorso di aggregazione pandas: niente sub-Series
+    # materializzate in Python per gruppo
+    names_by_slot = sub[NAME_COL].astype(str).groupby(slots).agg(list).to_dict()
+    order = pd.DataFrame({'slot': slots.drop_duplicates()})
+    order['slot_num'] = pd.to_numeric(order['slot'], errors='coerce')
+    order = order.sort_values(['slot_num', 'slot'], na_position='last')
+    counts = slots.value_counts()
+    return [(val, int(counts.get(val, 0)), names_by_slot.get(str(val), []))
+            for val in order['slot']]
+
+@_fragment
+def _render_carosello(ruolo_asta: str):
+    """Lista + carosello calciatori del ruolo in asta.
+
+    Come fragment, i click su prev/next/cerca rieseguono solo questo blocco
+    e non l'intera pagina (no-op sulle versioni senza st.fragment).
+    """
+    squadre = st.session_state.squadre
     st.markdown("### Lista Giocatori")
     try:
         df_raw = load_sheet_from_drive(ruolo_asta)
@@ -1020,14 +1475,14 @@ with tab_asta:
             if NAME_COL not in df_raw.columns:
                 st.error(f"Nel foglio '{ruolo_asta}' non esiste la colonna '{NAME_COL}'.")
             else:
-                df_view = rotate_from_letter(df_raw, NAME_COL, st.session_state.get("lettera_estratta", ""))
-                df_view[NAME_COL] = df_view[NAME_COL].astype(str).fillna("").str.strip()
+                # nomi già normalizzati una volta in _finalize_sheet
+                df_view = rotate_from_letter(ruolo_asta, NAME_COL, st.session_state.get("lettera_estratta", ""))
 
-                # Rimuovi calciatori già assegnati
-                def _norm(s):
-                    return str(s).strip().upper()
-                taken = {_norm(n) for n in elenco_giocatori_global()}
-                df_view = df_view[~df_view[NAME_COL].map(_norm).isin(taken)].reset_index(drop=True)
+                # Rimuovi calciatori già assegnati (frozenset cached per versione)
+                taken = _taken_set(st.session_state.state_version)
+                # kernel stringa pandas in C al posto della lambda per riga;
+                # i nomi sono già stripped da _finalize_sheet
+                df_view = df_view.loc[~df_view[NAME_COL].str.upper().isin(taken)].reset_index(drop=True)
 
                 # 🔎 Cerca + Pulisci
                 search_key = f"search_{ruolo_asta}"
@@ -1049,15 +1504,18 @@ with tab_asta:
 
                 q = st.session_state.get(search_key, "").strip().lower()
                 if q:
-                    cols_l = {c.lower(): c for c in df_view.columns}
+                    cols_l = df_view.attrs.get("cols_lower") or {c.lower(): c for c in df_view.columns}
                     team_c = cols_l.get('team')
                     slot_c = cols_l.get('slot')
-                    mask = df_view[NAME_COL].astype(str).str.lower().str.contains(q)
+                    # haystack unico nome|squadra|slot e un solo contains con
+                    # ricerca substring in C (regex=False): un passaggio invece
+                    # di tre e niente bool intermedi
+                    hay = df_view[NAME_COL].str.lower()
                     if team_c:
-                        mask |= df_view[team_c].astype(str).str.lower().str.contains(q)
+                        hay = hay + "|" + df_view[team_c].astype(str).str.lower()
                     if slot_c:
-                        mask |= df_view[slot_c].astype(str).str.lower().str.contains(q)
-                    df_view = df_view[mask].reset_index(drop=True)
+                        hay = hay + "|" + df_view[slot_c].astype(str).str.lower()
+                    df_view = df_view[hay.str.contains(q, regex=False)].reset_index(drop=True)
                 st.caption(f"Trovati {len(df_view)} calciatori")
 
                 key_idx = f"car_idx_{ruolo_asta}"
@@ -1080,8 +1538,10 @@ with tab_asta:
                             st.session_state[key_idx] = min(total-1, st.session_state[key_idx] + 1)
 
                     idx = st.session_state[key_idx]
-                    rec = df_view.iloc[idx]
-                    cols_lower = {c.lower(): c for c in df_view.columns}
+                    # riga singola come dict Python: lookup C-hash al posto
+                    # dell'indicizzazione pandas per ogni campo della card
+                    rec = df_view.iloc[idx].to_dict()
+                    cols_lower = df_view.attrs.get("cols_lower") or {c.lower(): c for c in df_view.columns}
 
                     colL, colR = st.columns([2,1], vertical_alignment="top")
 
@@ -1136,34 +1596,23 @@ with tab_asta:
 
                         st.markdown("---")
                         st.subheader("📝 Assegna a squadra")
-                        team_options = list(range(len(st.session_state.squadre)))
+                        team_names = st.session_state.team_names
+                        team_options = list(range(len(squadre)))
                         sel_team_idx = st.selectbox(
                             "Scegli squadra",
                             team_options,
                             index=min(st.session_state.my_team_idx, len(team_options)-1) if team_options else 0,
-                            format_func=lambda i: st.session_state.squadre[i].nome if team_options else "",
+                            format_func=team_names.__getitem__,
                             key=f"sel_team_{ruolo_asta}_{idx}"
                         )
                         prezzo_sel = st.number_input("Prezzo di aggiudicazione", min_value=0, step=1, key=f"prezzo_{ruolo_asta}_{idx}")
+                        # bind unico della squadra selezionata per tutto il blocco card
+                        team_sel = squadre[sel_team_idx]
 
                         # Commento vs range stimato
                         rng_col = cols_lower.get('pfcrange')
                         rng_val = rec[rng_col] if rng_col else None
-                        def _extract_ints(text):
-                            if text is None:
-                                return []
-                            s = str(text)
-                            out, buf = [], ""
-                            for ch in s:
-                                if ch.isdigit():
-                                    buf += ch
-                                else:
-                                    if buf:
-                                        out.append(int(buf)); buf = ""
-                            if buf:
-                                out.append(int(buf))
-                            return out
-                        nums = _extract_ints(rng_val)
+                        nums = [int(x) for x in _INT_RE.findall(str(rng_val or ""))]
                         low = high = None
                         if len(nums) >= 2:
                             a, b = nums[0], nums[1]
@@ -1185,8 +1634,7 @@ with tab_asta:
 
                         # Monitor spesa reparto (solo per la mia squadra) con TARGET DINAMICI
                         if sel_team_idx == st.session_state.get("user_team_idx", -1):
-                            team_sel = st.session_state.squadre[sel_team_idx]
-                            curr = spesa_per_ruolo(team_sel).get(ruolo_asta, 0)
+                            curr = team_sel.spesa[ruolo_asta]
                             targ = target_per_ruolo_dynamic(team_sel).get(ruolo_asta, 0)
                             projected = curr + int(prezzo_sel)
                             label_ruolo = ROLE_LABELS.get(ruolo_asta, ruolo_asta)
@@ -1198,7 +1646,6 @@ with tab_asta:
                                     st.warning(f"Superi il target {label_ruolo} di {projected - targ} crediti.")
 
                         if st.button("Aggiungi alla squadra", key=f"add_{ruolo_asta}_{idx}"):
-                            team_sel = st.session_state.squadre[sel_team_idx]
                             ok = aggiungi_giocatore(team_sel, rec[NAME_COL], ruolo_asta, int(prezzo_sel))
                             if ok:
                                 st.success(f"{rec[NAME_COL]} aggiunto a {team_sel.nome} per {int(prezzo_sel)}.")
@@ -1212,30 +1659,22 @@ with tab_asta:
 
                     with colR:
                         st.subheader("📊 Disponibilità")
+                        st.markdown(TOOLTIP_CSS, unsafe_allow_html=True)
                         # In gara (squadre non complete per questo reparto)
                         try:
                             quota = st.session_state.settings['quote_rosa'][ruolo_asta]
                             incomplete = [
                                 (t.nome, max(quota - len(t.rosa[ruolo_asta]), 0))
-                                for t in st.session_state.squadre
+                                for t in squadre
                                 if len(t.rosa[ruolo_asta]) < quota
                             ]
                             squadre_in_gara = len(incomplete)
-                            st.markdown("""
-                            <style>
-                            .tooltip-row{position:relative;padding:4px 2px;}
-                            .tooltip-row .hint{cursor:default;}
-                            .tooltip-row .tip{visibility:hidden;opacity:0;transition:opacity .15s ease;position:absolute;left:0;top:100%;background:#111;color:#fff;padding:8px 10px;border-radius:8px;z-index:1000;min-width:220px;max-width:420px;box-shadow:0 4px 12px rgba(0,0,0,.2);} 
-                            .tooltip-row:hover .tip{visibility:visible;opacity:1;} 
-                            .tooltip-row .tip ul{margin:6px 0 0 18px;padding:0;max-height:260px;overflow:auto;} 
-                            </style>
-                            """, unsafe_allow_html=True)
                             if squadre_in_gara > 0:
-                                li = []
-                                for name, miss in incomplete:
-                                    miss_txt = f"manca {miss}" if miss == 1 else f"mancano {miss}"
-                                    li.append(f"<li>{name} — {miss_txt}</li>")
-                                items_html = "".join(li)
+                                # join puro sulle stringhe: niente f-string per item
+                                items_html = "<li>" + "</li><li>".join(
+                                    f"{name} — " + ("manca 1" if miss == 1 else f"mancano {miss}")
+                                    for name, miss in incomplete
+                                ) + "</li>"
                                 html = f"<div class='tooltip-row'><span class='hint'>• In gara: {squadre_in_gara}</span><div class='tip'><strong>Squadre non complete</strong><ul>{items_html}</ul></div></div>"
                                 st.markdown(html, unsafe_allow_html=True)
                             else:
@@ -1244,41 +1683,49 @@ with tab_asta:
                             st.caption("In gara: n/d")
 
                         # Disponibilità per Slot (con tooltip dei nomi su hover)
-                        slot_col = cols_lower.get('slot')
-                        if slot_col and slot_col in df_view.columns:
-                            ser = df_view[slot_col].dropna().astype(str).str.strip()
-                            if len(ser) == 0:
-                                st.write("_Nessun dato disponibile_")
-                            else:
-                                df_slots = df_view[[slot_col, NAME_COL]].dropna(subset=[slot_col, NAME_COL]).copy()
-                                df_slots[slot_col] = df_slots[slot_col].astype(str).str.strip()
-                                names_by_slot = {str(sl): list(sub[NAME_COL].astype(str)) for sl, sub in df_slots.groupby(slot_col)}
-
-                                order = pd.DataFrame({'slot': ser}).drop_duplicates()
-                                order['slot_num'] = pd.to_numeric(order['slot'], errors='coerce')
-                                order = order.sort_values(['slot_num','slot'], na_position='last')
-                                counts = ser.value_counts()
-
-                                st.markdown("""
-                                <style>
-                                .tooltip-row{position:relative;padding:4px 2px;}
-                                .tooltip-row .hint{cursor:default;}
-                                .tooltip-row .tip{visibility:hidden;opacity:0;transition:opacity .15s ease;position:absolute;left:0;top:100%;background:#111;color:#fff;padding:8px 10px;border-radius:8px;z-index:1000;min-width:220px;max-width:420px;box-shadow:0 4px 12px rgba(0,0,0,.2);} 
-                                .tooltip-row:hover .tip{visibility:visible;opacity:1;} 
-                                .tooltip-row .tip ul{margin:6px 0 0 18px;padding:0;max-height:260px;overflow:auto;} 
-                                </style>
-                                """, unsafe_allow_html=True)
-                                for val in order['slot']:
-                                    cnt = int(counts.get(val, 0))
-                                    names = names_by_slot.get(str(val), [])
-                                    if names:
-                                        item_list = ''.join(f'<li>{n}</li>' for n in names)
-                                        html = f"<div class='tooltip-row'><span class='hint'>• Slot {val}: {cnt} disponibili</span><div class='tip'><strong>Giocatori disponibili (Slot {val})</strong><ul>{item_list}</ul></div></div>"
-                                    else:
-                                        html = f"<div class='tooltip-row'><span class='hint'>• Slot {val}: {cnt} disponibili</span></div>"
-                                    st.markdown(html, unsafe_allow_html=True)
-                        else:
+                        slot_rows = _slot_availability(ruolo_asta, st.session_state.state_version, q)
+                        if slot_rows is None:
                             st.caption("Colonna 'Slot' assente nel file.")
+                        elif not slot_rows:
+                            st.write("_Nessun dato disponibile_")
+                        else:
+                            # una sola emissione: ogni st.markdown è un delta
+                            # verso il frontend, qui le righe diventano un blob
+                            rows_html = []
+                            for val, cnt, names in slot_rows:
+                                if names:
+                                    item_list = '<li>' + '</li><li>'.join(names) + '</li>'
+                                    rows_html.append(f"<div class='tooltip-row'><span class='hint'>• Slot {val}: {cnt} disponibili</span><div class='tip'><strong>Giocatori disponibili (Slot {val})</strong><ul>{item_list}</ul></div></div>")
+                                else:
+                                    rows_html.append(f"<div class='tooltip-row'><span class='hint'>• Slot {val}: {cnt} disponibili</span></div>")
+                            st.markdown("".join(rows_html), unsafe_allow_html=True)
     except Exception as e:
         st.error(str(e))
 
+with tab_asta:
+    col_a, col_b = st.columns([1,1])
+    with col_a:
+        st.subheader("Ruolo in asta")
+        ruolo_asta = st.radio(
+            "Seleziona il ruolo per cui si sta svolgendo l'asta",
+            RUOLI,
+            index=0,
+            horizontal=True,
+            key="ruolo_asta",
+        )
+    with col_b:
+        st.subheader("Lettera estratta")
+        lettera_input = st.text_input(
+            "Inserisci la lettera alfabetica estratta (A–Z)",
+            value=st.session_state.get("lettera_estratta", ""),
+            max_chars=1,
+        )
+        st.session_state["lettera_estratta"] = (lettera_input or "").upper()
+
+    _render_carosello(ruolo_asta)
+
+
+# ===============================
+# FLUSH STATO (debounced, a fine script)
+# ===============================
+maybe_flush_state()